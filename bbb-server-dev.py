@@ -1,9 +1,15 @@
 import ctypes
-from fastapi import FastAPI, WebSocket
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 import asyncio
+import concurrent.futures
+from contextlib import asynccontextmanager
 import psutil
 import json
+import orjson
+import msgpack
 import os
+import threading
+import time
 from ctypes.util import find_library
 
 # Attempt to find and load the shared library
@@ -39,13 +45,225 @@ class IMUData(ctypes.Structure):
 
 imu_data = IMUData()
 
+# Declare the librobotcontrol prototypes once so ctypes converts arguments
+# natively instead of needing a c_* wrapper object on every call
+robotcontrol_lib.rc_motor_set.argtypes = [ctypes.c_int, ctypes.c_double]
+robotcontrol_lib.rc_motor_set.restype = ctypes.c_int
+robotcontrol_lib.rc_servo_send_pulse_us.argtypes = [ctypes.c_int, ctypes.c_int]
+robotcontrol_lib.rc_servo_send_pulse_us.restype = ctypes.c_int
+robotcontrol_lib.rc_imu_read.argtypes = [ctypes.POINTER(IMUData)]
+robotcontrol_lib.rc_imu_read.restype = ctypes.c_int
+robotcontrol_lib.rc_encoder_read.argtypes = [ctypes.c_int]
+robotcontrol_lib.rc_encoder_read.restype = ctypes.c_int
+robotcontrol_lib.rc_battery_voltage.argtypes = []
+robotcontrol_lib.rc_battery_voltage.restype = ctypes.c_double
+
+# Channel keys used in command and sensor payloads, built once
+MOTOR_KEYS = tuple(f"motor_{i}" for i in range(1, 5))
+SERVO_KEYS = tuple(f"servo_{i}" for i in range(1, 9))
+ENCODER_KEYS = tuple(f"encoder_{i}" for i in range(1, 5))
+
+# Bring up the sensor worker thread and the system sampler for each app
+# lifespan, and on shutdown stop every sensor producer and wait for any
+# librobotcontrol read still running on the sensor thread, so cleanup() never
+# tears the library down underneath an in-flight call
+@asynccontextmanager
+async def lifespan(app):
+    global sensor_executor
+    sensor_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    sampler_stop = threading.Event()
+    sampler = threading.Thread(target=sample_system_metrics, args=(sampler_stop,), daemon=True)
+    sampler.start()
+    try:
+        yield
+    finally:
+        for stream in (imu_stream, encoder_stream, battery_stream, metrics_stream):
+            if stream.task is not None:
+                stream.task.cancel()
+                stream.task = None
+        sampler_stop.set()
+        # Both waits block, so keep them off the event loop while uvicorn is
+        # still closing connections
+        await asyncio.to_thread(sensor_executor.shutdown, wait=True, cancel_futures=True)
+        await asyncio.to_thread(sampler.join)
+
 # FastAPI setup
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+# Accept a sensor stream and pick its wire format: clients offering the
+# "msgpack" subprotocol get MessagePack binary frames, everyone else keeps
+# getting JSON text frames
+async def accept_stream(websocket):
+    if "msgpack" in websocket.scope.get("subprotocols", []):
+        await websocket.accept(subprotocol="msgpack")
+        return "msgpack"
+    await websocket.accept()
+    return "json"
+
+# One packer reused for every msgpack frame; frames are only ever encoded on
+# the event loop thread, so it is never used concurrently
+msgpack_packer = msgpack.Packer()
+
+# Encode a payload into a ready-to-send ASGI message for one wire format. JSON
+# goes through orjson rather than the stdlib encoder websocket.send_json uses.
+def encode_frame(wire_format, data):
+    if wire_format == "msgpack":
+        return {"type": "websocket.send", "bytes": msgpack_packer.pack(data)}
+    return {"type": "websocket.send", "text": orjson.dumps(data).decode()}
+
+# Receive one JSON command, sent as either a text or a binary frame, and parse
+# it with orjson instead of the stdlib json that websocket.receive_json uses
+async def receive_orjson(websocket):
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    if message.get("text") is not None:
+        return orjson.loads(message["text"])
+    return orjson.loads(message["bytes"])
+
+# Sleep until the next tick of a fixed-rate stream. Deadlines are absolute so
+# time spent reading and sending doesn't stretch the period; if a tick overran,
+# skip ahead instead of bursting to catch up.
+async def wait_next_tick(deadline, period):
+    loop = asyncio.get_running_loop()
+    deadline += period
+    now = loop.time()
+    if deadline < now:
+        deadline = now
+    await asyncio.sleep(deadline - now)
+    return deadline
+
+# librobotcontrol reads block on I2C/PRU transactions. Run them on a single
+# worker thread so the event loop keeps serving other connections meanwhile,
+# and so reads from different streams never overlap on the bus. Created by
+# lifespan() on startup.
+sensor_executor = None
+
+# A client that can't take a frame within this many seconds is dropped
+SEND_TIMEOUT = 0.5
+
+# Upper bound on clients per sensor stream, so a misbehaving client that keeps
+# reconnecting can't pin an unbounded number of mailboxes and sender tasks
+MAX_SUBSCRIBERS = 32
+
+# A periodic sensor stream shared by every client subscribed to it. A single
+# producer task reads the sensor once per tick, encodes the payload once per
+# wire format in use and hands that same frame to each subscriber. The
+# producer only runs while at least one client is connected.
+class SensorStream:
+    def __init__(self, name, read, period, blocking=True):
+        self.name = name
+        self.read = read
+        self.period = period
+        self.blocking = blocking
+        self.subscribers = {}
+        # Connections holding a slot, counted from before the handshake
+        self.connections = 0
+        # Rebuilt on (un)subscribe so a tick never copies the subscriber dict
+        self.snapshot = ()
+        self.task = None
+        # Copy of the last payload sent; unchanged ticks aren't re-sent
+        self.last_sent = None
 
-# Motor control function
-def set_motor(motor_id, speed):
-    if robotcontrol_lib.rc_motor_set(motor_id, ctypes.c_float(speed)) != 0:
-        print(f"Error: Failed to set motor {motor_id} speed")
+    def subscribe(self, websocket, wire_format):
+        # Each client gets a one-slot mailbox holding only its newest frame
+        queue = asyncio.Queue(maxsize=1)
+        self.subscribers[websocket] = (wire_format, queue)
+        self.snapshot = tuple(self.subscribers.values())
+        # Make sure the new client gets the current values on the next tick
+        self.last_sent = None
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+        return queue
+
+    def unsubscribe(self, websocket):
+        if self.subscribers.pop(websocket, None) is None:
+            return
+        self.snapshot = tuple(self.subscribers.values())
+        if not self.subscribers and self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def serve(self, websocket):
+        if self.connections >= MAX_SUBSCRIBERS:
+            # 1013: Try Again Later
+            await websocket.accept()
+            await websocket.close(code=1013)
+            return
+        # Take the slot before awaiting the handshake, so concurrent connects
+        # can't all pass the check above
+        self.connections += 1
+        sender = None
+        try:
+            queue = self.subscribe(websocket, await accept_stream(websocket))
+            sender = asyncio.create_task(self.send_frames(websocket, queue))
+            # Clients never send anything useful; just wait for the disconnect
+            while (await websocket.receive())["type"] != "websocket.disconnect":
+                pass
+        finally:
+            if sender is not None:
+                sender.cancel()
+            self.unsubscribe(websocket)
+            self.connections -= 1
+
+    # Deliver frames to one client. A slow client only ever has the newest
+    # frame waiting, so it sees a downsampled stream instead of holding up the
+    # producer or the other subscribers. A client whose send fails or times
+    # out is closed with 1013 (Try Again Later) so it reconnects, rather than
+    # left connected and no longer receiving anything.
+    async def send_frames(self, websocket, queue):
+        while True:
+            frame = await queue.get()
+            try:
+                await asyncio.wait_for(websocket.send(frame), SEND_TIMEOUT)
+            except Exception as e:
+                print(f"Error in {self.name} WebSocket stream: {e!r}")
+                self.unsubscribe(websocket)
+                try:
+                    await asyncio.wait_for(websocket.close(code=1013), SEND_TIMEOUT)
+                except Exception:
+                    pass
+                return
+
+    async def run(self):
+        # Hoist the names that never change while the stream runs. snapshot
+        # and last_sent stay on self because (un)subscribe replaces them, and
+        # sensor_executor stays global because lifespan() recreates it.
+        read = self.read
+        period = self.period
+        blocking = self.blocking
+        encode = encode_frame
+        wait = wait_next_tick
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+        while True:
+            try:
+                if blocking:
+                    data = await loop.run_in_executor(sensor_executor, read)
+                else:
+                    data = read()
+            except Exception as e:
+                print(f"Error in {self.name} WebSocket stream: {e}")
+                data = None
+            if data is not None and data != self.last_sent:
+                self.last_sent = dict(data)
+                frames = {}
+                for wire_format, queue in self.snapshot:
+                    frame = frames.get(wire_format)
+                    if frame is None:
+                        frame = frames[wire_format] = encode(wire_format, data)
+                    # Replace any frame the client hasn't picked up yet
+                    if queue.full():
+                        queue.get_nowait()
+                    queue.put_nowait(frame)
+            deadline = await wait(deadline, period)
+
+# Apply all four motor speeds from one command in a single pass
+def set_motors(data):
+    rc_motor_set = robotcontrol_lib.rc_motor_set
+    for i, key in enumerate(MOTOR_KEYS, 1):
+        if rc_motor_set(i, data.get(key, 0.0)) != 0:
+            print(f"Error: Failed to set motor {i} speed")
 
 # WebSocket handler for motor control
 @app.websocket("/ws/motors")
@@ -53,16 +271,17 @@ async def motors_endpoint(websocket: WebSocket):
     await websocket.accept()
     try:
         while True:
-            data = await websocket.receive_json()
-            for i in range(1, 5):
-                set_motor(i, data.get(f"motor_{i}", 0.0))
+            data = await receive_orjson(websocket)
+            set_motors(data)
             await websocket.send_text("Motor speeds updated")
     except Exception as e:
         print(f"Error in motor WebSocket control: {e}")
 
-# Servo control function (example usage)
-def set_servo(channel, position):
-    robotcontrol_lib.rc_servo_send_pulse_us(channel, ctypes.c_int(position))
+# Apply all eight servo pulses from one command in a single pass
+def set_servos(data):
+    rc_servo_send_pulse_us = robotcontrol_lib.rc_servo_send_pulse_us
+    for i, key in enumerate(SERVO_KEYS, 1):
+        rc_servo_send_pulse_us(i, data.get(key, 1500))
 
 # Function to read IMU data with error checking
 def read_imu_data():
@@ -77,38 +296,33 @@ def read_imu_data():
             "temp": imu_data.temp
         }
 
+imu_stream = SensorStream("IMU", read_imu_data, 0.1)
+
 # WebSocket endpoint for IMU data
 @app.websocket("/ws/imu")
 async def imu_data_stream(websocket: WebSocket):
-    await websocket.accept()
-    try:
-        while True:
-            imu_data_read = read_imu_data()
-            if imu_data_read:
-                await websocket.send_json(imu_data_read)
-            await asyncio.sleep(0.1)
-    except Exception as e:
-        print(f"Error in IMU WebSocket stream: {e}")
+    await imu_stream.serve(websocket)
 
-# Function to get encoder data using real library call
-def get_encoder(encoder_id):
-    encoder_value = robotcontrol_lib.rc_encoder_read(ctypes.c_int(encoder_id))
-    if encoder_value == -1:
-        print(f"Error: Failed to read encoder {encoder_id}")
-        return None
-    return encoder_value
+# Encoder payload keys never change, so every tick refills the same dict
+encoder_data = dict.fromkeys(ENCODER_KEYS)
+
+# Fill the encoder payload for all four channels with one library lookup
+def read_encoders():
+    rc_encoder_read = robotcontrol_lib.rc_encoder_read
+    for i, key in enumerate(ENCODER_KEYS, 1):
+        encoder_value = rc_encoder_read(i)
+        if encoder_value == -1:
+            print(f"Error: Failed to read encoder {i}")
+            encoder_value = None
+        encoder_data[key] = encoder_value
+    return encoder_data
+
+encoder_stream = SensorStream("encoder", read_encoders, 0.1)
 
 # WebSocket endpoint for encoder data
 @app.websocket("/ws/encoder")
 async def encoder_data_stream(websocket: WebSocket):
-    await websocket.accept()
-    try:
-        while True:
-            enc_data = {f"encoder_{i}": get_encoder(i) for i in range(1, 5)}
-            await websocket.send_json(enc_data)
-            await asyncio.sleep(0.1)
-    except Exception as e:
-        print(f"Error in encoder WebSocket stream: {e}")
+    await encoder_stream.serve(websocket)
 
 # Function to get battery voltage
 def get_battery_voltage():
@@ -117,23 +331,37 @@ def get_battery_voltage():
         print("Error: Failed to read battery voltage")
     return voltage
 
+battery_data = {"voltage": None}
+
+def read_battery():
+    battery_data["voltage"] = get_battery_voltage()
+    return battery_data
+
+battery_stream = SensorStream("battery", read_battery, 1)
+
 # WebSocket endpoint for battery monitoring
 @app.websocket("/ws/battery")
 async def battery_monitoring(websocket: WebSocket):
-    await websocket.accept()
-    try:
-        while True:
-            voltage = get_battery_voltage()
-            await websocket.send_json({"voltage": voltage})
-            await asyncio.sleep(1)
-    except Exception as e:
-        print(f"Error in battery WebSocket stream: {e}")
+    await battery_stream.serve(websocket)
+
+# Network interfaces rarely change, so only re-walk them every 30 seconds
+NET_INFO_TTL = 30
+net_info_cache = (0.0, None)
+
+def get_network_info():
+    global net_info_cache
+    now = time.monotonic()
+    if net_info_cache[1] is None or now - net_info_cache[0] > NET_INFO_TTL:
+        net_info = psutil.net_if_addrs()
+        net_info_cache = (now, {
+            iface: [{"ip": addr.address, "netmask": addr.netmask} for addr in addrs if addr.family == 2]
+            for iface, addrs in net_info.items()
+        })
+    return net_info_cache[1]
 
 # CPU, Memory, and Network monitoring function
-def get_system_metrics():
-    cpu_usage = psutil.cpu_percent(interval=1)
+def get_system_metrics(cpu_usage):
     memory_info = psutil.virtual_memory()
-    net_info = psutil.net_if_addrs()
     return {
         "cpu_usage": cpu_usage,
         "memory": {
@@ -142,23 +370,27 @@ def get_system_metrics():
             "used": memory_info.used,
             "percent": memory_info.percent
         },
-        "network": {
-            iface: [{"ip": addr.address, "netmask": addr.netmask} for addr in addrs if addr.family == 2]
-            for iface, addrs in net_info.items()
-        }
+        "network": get_network_info()
     }
 
+# Latest system metrics snapshot, refreshed once a second by the sampler thread
+system_metrics = None
+
+# Blocking system sampler, kept off the event loop in its own thread so every
+# system_metrics client shares one snapshot instead of querying psutil itself.
+# Runs until lifespan() sets the stop event on shutdown.
+def sample_system_metrics(stop):
+    global system_metrics
+    while not stop.is_set():
+        cpu_usage = psutil.cpu_percent(interval=1)
+        system_metrics = get_system_metrics(cpu_usage)
+
+metrics_stream = SensorStream("system metrics", lambda: system_metrics, 1, blocking=False)
+
 # WebSocket endpoint for system metrics
 @app.websocket("/ws/system_metrics")
 async def system_metrics_stream(websocket: WebSocket):
-    await websocket.accept()
-    try:
-        while True:
-            sys_metrics = get_system_metrics()
-            await websocket.send_json(sys_metrics)
-            await asyncio.sleep(1)
-    except Exception as e:
-        print(f"Error in system metrics WebSocket stream: {e}")
+    await metrics_stream.serve(websocket)
 
 # WebSocket endpoint for servo control (preparing for future use)
 @app.websocket("/ws/servo")
@@ -166,9 +398,8 @@ async def servo_control(websocket: WebSocket):
     await websocket.accept()
     try:
         while True:
-            data = await websocket.receive_json()
-            for i in range(1, 9):
-                set_servo(i, data.get(f"servo_{i}", 1500))
+            data = await receive_orjson(websocket)
+            set_servos(data)
             await websocket.send_text("Servo positions updated")
     except Exception as e:
         print(f"Error in servo WebSocket control: {e}")
@@ -184,4 +415,7 @@ atexit.register(cleanup)
 # Start the server
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    # uvicorn's "auto" loop, HTTP and WebSocket choices already pick uvloop,
+    # httptools and websockets when they're installed (see
+    # requirements-server.txt) and fall back instead of failing to start
+    uvicorn.run(app, host="0.0.0.0", port=8001, ws_per_message_deflate=False)
\ No newline at end of file
@@ -4,6 +4,7 @@ import websockets
 import json
 import requests
 import time
+import random
 
 # Azure REST endpoint (replace with your actual endpoint)
 AZURE_REST_API_URL = "https://bbb-telemetry-apim.azure-api.net/api/processTelemetry"
@@ -15,11 +16,13 @@ headers = {
 
 async def collect_data_from_bbb():
     uri = "ws://192.168.2.241:8001/ws/data"
-    async with websockets.connect(uri) as websocket:
+    received = False
+    async with websockets.connect(uri, compression=None) as websocket:
         while True:
             try:
                 # Receive data from BeagleBone Blue WebSocket server
                 message = await websocket.recv()
+                received = True
                 data = json.loads(message)
                 print(f"Received data: {data}")
                 
@@ -39,15 +42,30 @@ async def collect_data_from_bbb():
 
             except websockets.exceptions.ConnectionClosedError:
                 print("WebSocket connection closed unexpectedly. Attempting to reconnect...")
-                await asyncio.sleep(5)  # Wait before attempting to reconnect
                 break  # Exit loop and let the outer code retry connecting
 
             except Exception as e:
                 print(f"Unexpected Error: {e}")
                 break
+    return received
+
+# Keep collecting across disconnects, backing off exponentially with jitter so
+# a fleet of clients doesn't hammer the BBB in lockstep while it restarts
+async def collect_with_reconnect():
+    backoff = 0.5
+    while True:
+        try:
+            if await collect_data_from_bbb():
+                backoff = 0.5  # The session delivered data, so restart from a short delay
+        except (OSError, asyncio.TimeoutError, websockets.exceptions.WebSocketException) as e:
+            print(f"Connection to BBB failed: {e}")
+        delay = min(backoff, 15) * (0.5 + random.random())
+        backoff *= 2
+        print(f"Reconnecting in {delay:.1f} seconds...")
+        await asyncio.sleep(delay)
 
 if __name__ == "__main__":
     try:
-        asyncio.run(collect_data_from_bbb())
+        asyncio.run(collect_with_reconnect())
     except KeyboardInterrupt:
         print("Client disconnected.")
\ No newline at end of file
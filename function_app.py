@@ -1,18 +1,40 @@
 import azure.functions as func
 import logging
-import json
+import orjson
+
+# Telemetry frames are a few KB at most; anything bigger is rejected unparsed
+MAX_TELEMETRY_BYTES = 64 * 1024
 
 # Define the function app
 app = func.FunctionApp(http_auth_level=func.AuthLevel.FUNCTION)
 
 @app.route(route="processTelemetry", methods=["POST"])  # Name it based on your Azure route setup
-def process_telemetry(req: func.HttpRequest) -> func.HttpResponse:
+async def process_telemetry(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Processing telemetry data.')
 
     try:
-        # Attempt to read the JSON payload from the request
-        telemetry_data = req.get_json()
-        logging.info(f"Received telemetry data: {json.dumps(telemetry_data)}")
+        body = req.get_body()
+
+        # Reject empty or oversized payloads before paying for a parse
+        if not body:
+            logging.error("Empty telemetry payload received.")
+            return func.HttpResponse(
+                "Empty telemetry payload.",
+                status_code=400
+            )
+        if len(body) > MAX_TELEMETRY_BYTES:
+            logging.error(f"Telemetry payload too large: {len(body)} bytes")
+            return func.HttpResponse(
+                "Telemetry payload too large.",
+                status_code=413
+            )
+
+        # Attempt to parse the JSON payload from the request body; the raw body
+        # is already JSON text, so log it as-is instead of re-serializing
+        telemetry_data = orjson.loads(body)
+        # Skip decoding the body entirely when INFO logging is switched off
+        if logging.getLogger().isEnabledFor(logging.INFO):
+            logging.info("Received telemetry data: %s", body.decode())
 
         # You could add additional processing logic here if needed
         # For example, saving it to a database or triggering another function
@@ -2,13 +2,19 @@ import asyncio
 import websockets
 import json
 
+# uvloop is optional here; fall back to the stock event loop without it
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 # Define the BeagleBone Blue IP address and WebSocket endpoints
 bbb_ip = "192.168.2.241"
 ws_port = 8001
 
 async def test_websocket(uri):
     try:
-        async with websockets.connect(uri) as websocket:
+        async with websockets.connect(uri, compression=None) as websocket:
             while True:
                 message = await websocket.recv()
                 data = json.loads(message)
@@ -25,12 +31,15 @@ async def main():
         "System Metrics": f"ws://{bbb_ip}:{ws_port}/ws/system_metrics",
     }
 
-    # Create tasks to connect to each endpoint concurrently
-    tasks = [test_websocket(uri) for name, uri in endpoints.items()]
-
-    await asyncio.gather(*tasks)
+    # Connect to each endpoint concurrently; test_websocket reports its own
+    # failures, so one endpoint going down leaves the others running
+    async with asyncio.TaskGroup() as tg:
+        for name, uri in endpoints.items():
+            tg.create_task(test_websocket(uri), name=name)
 
 if __name__ == "__main__":
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
     try:
         asyncio.run(main())
     except KeyboardInterrupt: